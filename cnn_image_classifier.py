@@ -2,22 +2,32 @@ import os
 import shutil
 import hashlib
 import uuid
+import json
+import queue
+import threading
 from pathlib import Path
 import tensorflow as tf
 from tensorflow.keras import layers, models
 from tensorflow.keras.preprocessing import image_dataset_from_directory
 from tensorflow.keras.callbacks import ModelCheckpoint
+from throughput_autotuner import architecture_key, load_tuned_config, TRIAL_ENV_VAR, main as autotune_main
 
 # Configurări de bază
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
 os.environ['TF_ENABLE_ONEDNN_OPTS'] = '0'
 
 BATCH_SIZE = 32
+TRAIN_BATCH_SIZE = BATCH_SIZE  # Suprascrise de configurația din autotune, dacă există
+PREDICT_BATCH_SIZE = BATCH_SIZE
 IMG_SIZE = (224, 224)
 EPOCHS = 20
 DATASET_PATH = "./data_project/dataset_split"
 RESULTS_PATH = "./data_project/models_results"
 MODELS_PATH = "./data_project/models"
+MANIFEST_FILE = "predictions_manifest.jsonl"
+WRITER_THREADS = 4
+WRITER_QUEUE_SIZE = 64
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.gif')
 
 # Clase implicte: Oameni, Animale, Vehicule
 
@@ -52,6 +62,31 @@ def create_model(num_classes):
     ])
     return model
 
+# Funcție pentru aplicarea configurației salvate de autotune pentru host-ul și arhitectura curentă
+def apply_tuned_config():
+    """
+    Trebuie apelată înainte de prima operație TensorFlow, altfel setările de thread-uri nu mai pot fi aplicate.
+    """
+    global TRAIN_BATCH_SIZE, PREDICT_BATCH_SIZE
+    if os.environ.get(TRIAL_ENV_VAR):
+        return  # Trial-urile de autotune își setează singure thread-urile și batch-ul
+    config = load_tuned_config(architecture_key(create_model))
+    if config is None:
+        return
+
+    TRAIN_BATCH_SIZE = config["train_batch_size"]
+    PREDICT_BATCH_SIZE = config["predict_batch_size"]
+    try:
+        tf.config.threading.set_intra_op_parallelism_threads(config["intra_op_threads"])
+        tf.config.threading.set_inter_op_parallelism_threads(config["inter_op_threads"])
+    except RuntimeError as e:
+        print(f"Warning: could not apply tuned thread settings: {e}")
+    print(f"Loaded autotune config: train batch {TRAIN_BATCH_SIZE}, predict batch {PREDICT_BATCH_SIZE}, "
+          f"intra-op threads {config['intra_op_threads']}, inter-op threads {config['inter_op_threads']}.")
+
+
+apply_tuned_config()
+
 # Funcție pentru antrenarea modelului
 def train_model(selected_class):
     print(f"Starting training for class '{selected_class}'...")
@@ -64,13 +99,13 @@ def train_model(selected_class):
     train_dataset = image_dataset_from_directory(
         directory=train_dir,
         image_size=IMG_SIZE,
-        batch_size=BATCH_SIZE,
+        batch_size=TRAIN_BATCH_SIZE,
         class_names=[selected_class]  # Specificăm clasa dorită
     )
     val_dataset = image_dataset_from_directory(
         directory=val_dir,
         image_size=IMG_SIZE,
-        batch_size=BATCH_SIZE,
+        batch_size=TRAIN_BATCH_SIZE,
         class_names=[selected_class]  # Specificăm clasa dorită
     )
 
@@ -100,8 +135,180 @@ def train_model(selected_class):
     print(f"Model for class '{selected_class}' has been trained and saved at {model_file}.")
 
 
+# Funcție pentru calcularea hash-ului unui fișier sursă
+def calculate_file_hash(file_path):
+    """
+    Calculează hash-ul MD5 al conținutului unui fișier, citind pe bucăți.
+    """
+    md5 = hashlib.md5()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+class PredictionManifest:
+    """
+    Manifest persistent al predicțiilor (cale, clasă, scor, hash, model) pentru o clasă.
+    Înlocuiește recalcularea hash-urilor la pornire și permite sărirea imaginilor deja clasificate
+    de același model; după reantrenare, imaginile sunt clasificate din nou.
+    """
+
+    def __init__(self, manifest_path, model_id):
+        self.path = Path(manifest_path)
+        self.model_id = model_id
+        self.lock = threading.Lock()
+        self.classified = set()
+        self.saved_hashes = set()
+
+        if self.path.exists():
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # Linie incompletă rămasă după o întrerupere
+                    if entry.get("model") == model_id:
+                        self.classified.add(entry["path"])
+                    if entry.get("saved"):
+                        self.saved_hashes.add(entry["hash"])  # Fișierele salvate rămân pe disc
+        elif any(self.path.parent.glob("*.jpg")):
+            # Imaginile salvate de versiunile anterioare sunt re-encodate; hash-ul lor nu corespunde sursei
+            print(f"Note: no manifest in {self.path.parent}; previously saved images are not used for deduplication.")
+
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+    def reserve_hash(self, image_hash):
+        """
+        Rezervă un hash pentru salvare. Returnează False dacă imaginea a fost deja salvată.
+        """
+        with self.lock:
+            if image_hash in self.saved_hashes:
+                return False
+            self.saved_hashes.add(image_hash)
+            return True
+
+    def release_hash(self, image_hash):
+        with self.lock:
+            self.saved_hashes.discard(image_hash)
+
+    def record(self, source_path, selected_class, predicted, score, image_hash, saved_path):
+        entry = {
+            "path": source_path,
+            "class": selected_class,
+            "predicted": predicted,
+            "score": score,
+            "hash": image_hash,
+            "saved": str(saved_path) if saved_path else None,
+            "model": self.model_id
+        }
+        with self.lock:
+            self._file.write(json.dumps(entry) + "\n")
+            self._file.flush()
+            self.classified.add(source_path)
+
+    def close(self):
+        with self.lock:
+            self._file.close()
+
+
+class AsyncResultWriter:
+    """
+    Salvează rezultatele în fundal, cu un pool de thread-uri și o coadă limitată,
+    astfel încât scrierea pe disc să se suprapună cu predicția.
+    """
+
+    def __init__(self, results_dir, selected_class, manifest, link_originals=False,
+                 num_workers=WRITER_THREADS, queue_size=WRITER_QUEUE_SIZE):
+        self.results_dir = Path(results_dir)
+        self.selected_class = selected_class
+        self.manifest = manifest
+        self.link_originals = link_originals
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.workers = [threading.Thread(target=self._worker, daemon=True) for _ in range(num_workers)]
+        for worker in self.workers:
+            worker.start()
+
+    def submit(self, source_path, image, predicted, score, positive, batch_index, image_hash=None):
+        # Blochează dacă coada este plină, limitând memoria folosită
+        self.queue.put((source_path, image, predicted, score, positive, batch_index, image_hash))
+
+    def close(self):
+        for _ in self.workers:
+            self.queue.put(None)
+        for worker in self.workers:
+            worker.join()
+
+    def _worker(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            try:
+                self._write(*item)
+            except Exception as e:
+                print(f"Error saving result for {item[0]}: {e}")
+
+    def _write(self, source_path, image, predicted, score, positive, batch_index, image_hash):
+        if image_hash is None:
+            image_hash = calculate_file_hash(source_path)
+        saved_path = None
+
+        if positive:
+            if self.manifest.reserve_hash(image_hash):  # Salvăm doar imaginile unice
+                try:
+                    saved_path = self._save(source_path, image, batch_index)
+                except Exception:
+                    self.manifest.release_hash(image_hash)
+                    raise
+                print(f"Saved image for class '{self.selected_class}': {saved_path}")
+            else:
+                print(f"Duplicate image skipped for class '{self.selected_class}'.")
+
+        self.manifest.record(source_path, self.selected_class, predicted, score, image_hash, saved_path)
+
+    def _save(self, source_path, image, batch_index):
+        unique_name = f"image_{batch_index}_{uuid.uuid4().hex[:8]}"
+        if self.link_originals:
+            # Legătură hard către fișierul original, fără re-encodare
+            image_path = self.results_dir / f"{unique_name}{Path(source_path).suffix.lower()}"
+            try:
+                os.link(source_path, image_path)
+            except OSError:
+                shutil.copy2(source_path, image_path)  # Ex. sisteme de fișiere diferite
+        else:
+            image_path = self.results_dir / f"{unique_name}.jpg"
+            tf.keras.preprocessing.image.save_img(str(image_path), image)
+        return image_path
+
+
+# Funcție pentru listarea imaginilor dintr-un director (recursiv)
+def list_image_paths(directory):
+    return sorted(
+        os.path.abspath(path) for path in Path(directory).rglob("*")
+        if path.suffix.lower() in IMAGE_EXTENSIONS
+    )
+
+
+# Funcție pentru crearea unui dataset din căile imaginilor
+def load_images_dataset(image_paths, batch_size=None):
+    """
+    Batch-ul implicit este cel acordat pentru inferența cu `create_model`; alte modele trebuie să-și
+    transmită propriul batch.
+    """
+    def load_image(path):
+        image = tf.io.decode_image(tf.io.read_file(path), channels=3, expand_animations=False)
+        image = tf.image.resize(image, IMG_SIZE)
+        image.set_shape((IMG_SIZE[0], IMG_SIZE[1], 3))
+        return image
+
+    dataset = tf.data.Dataset.from_tensor_slices(image_paths)
+    dataset = dataset.map(load_image, num_parallel_calls=tf.data.AUTOTUNE)
+    return dataset.batch(batch_size or PREDICT_BATCH_SIZE).prefetch(tf.data.AUTOTUNE)
+
+
 # Funcție pentru rularea modelului pe o singură clasă
-def process_class(selected_class):
+def process_class(selected_class, link_originals=False):
     print(f"Processing images for class '{selected_class}'...")
     model_file = f"{MODELS_PATH}/{selected_class}.keras"
 
@@ -122,40 +329,40 @@ def process_class(selected_class):
     class_results_dir = Path(f"{RESULTS_PATH}/CNN_Custom/{selected_class}")
     class_results_dir.mkdir(parents=True, exist_ok=True)
 
-    # Evităm duplicatele folosind hash-uri
-    saved_hashes = set(
-        hashlib.md5(open(str(image_path), 'rb').read()).hexdigest()
-        for image_path in class_results_dir.glob("*.jpg")
-    )
+    # Manifestul conține hash-urile imaginilor salvate și imaginile deja clasificate de acest model
+    manifest = PredictionManifest(class_results_dir / MANIFEST_FILE, calculate_file_hash(model_file))
 
-    # Încărcăm dataset-ul de test
+    # Încărcăm imaginile de test, sărind peste cele deja clasificate
     test_dir = f"{DATASET_PATH}/test/Custom"
-    test_dataset = image_dataset_from_directory(
-        directory=test_dir,
-        image_size=IMG_SIZE,
-        batch_size=BATCH_SIZE
-    )
+    all_paths = list_image_paths(test_dir)
+    image_paths = [path for path in all_paths if path not in manifest.classified]
+    print(f"Found {len(all_paths)} test images, {len(all_paths) - len(image_paths)} already classified.")
+    if not image_paths:
+        manifest.close()
+        print("All test images processed. End of sequence.")
+        return
+
+    test_dataset = load_images_dataset(image_paths)
+    writer = AsyncResultWriter(class_results_dir, selected_class, manifest, link_originals=link_originals)
+
+    # Procesăm imaginile din setul de test; salvarea rulează în fundal
+    try:
+        offset = 0
+        for batch_index, images in enumerate(test_dataset):
+            # Un singur pas pe tot batch-ul, ca în trial-urile de autotune (`predict` ar împărți în loturi de 32)
+            predictions = model.predict_on_batch(images)
 
-    # Procesăm imaginile din setul de test
-    for batch_index, batch in enumerate(test_dataset):
-        images, labels = batch
-        predictions = model.predict(images)
-
-        for i, prediction in enumerate(predictions):
-            if prediction.argmax() == 1:  # Dacă imaginea este clasificată pozitiv pentru clasa selectată
-                print(f"Dacă imaginea este clasificată pozitiv pentru clasa selectată.")
-                # Generăm un nume unic pentru imagine
-                image_hash = hashlib.md5(images[i].numpy().tobytes()).hexdigest()
-                if image_hash not in saved_hashes:  # Salvăm doar imaginile unice
-                    unique_name = f"image_{batch_index}_{uuid.uuid4().hex[:8]}.jpg"
-                    image_path = class_results_dir / unique_name
-                    tf.keras.preprocessing.image.save_img(str(image_path), images[i])
-                    saved_hashes.add(image_hash)
-                    print(f"Saved image for class '{selected_class}': {image_path}")
-                else:
-                    print(f"Duplicate image skipped for class '{selected_class}'.")
-            # else:
-                # print(f"Imaginea NU este clasificată pozitiv pentru clasa selectată")
+            for i, prediction in enumerate(predictions):
+                predicted = int(prediction.argmax())
+                positive = predicted == 1  # Dacă imaginea este clasificată pozitiv pentru clasa selectată
+                image = None if link_originals or not positive else images[i].numpy()
+                # Scorul din manifest este mereu probabilitatea clasei pozitive, ca în `embedding_classifier`
+                score = float(prediction[1]) if len(prediction) > 1 else float(prediction[0])
+                writer.submit(image_paths[offset + i], image, predicted, score, positive, batch_index)
+            offset += len(predictions)
+    finally:
+        writer.close()
+        manifest.close()
     print("All test images processed. End of sequence.")
 
 # Funcția principală
@@ -164,7 +371,7 @@ def main():
         return
 
     while True:
-        print("\nAvailable actions: train_model, run_model")
+        print("\nAvailable actions: train_model, run_model, autotune")
         action = input("Enter the action you want to perform: ").strip()
 
         if action == "train_model":
@@ -172,9 +379,13 @@ def main():
             train_model(selected_class)
         elif action == "run_model":
             selected_class = input("Enter the name of the class to process (e.g., Oameni): ").strip()
-            process_class(selected_class)
+            link_choice = input("Hardlink original files instead of re-encoding? (yes/no): ").strip().lower()
+            process_class(selected_class, link_originals=link_choice == "yes")
+        elif action == "autotune":
+            autotune_main()
+            print("Tuned settings will be applied on the next start of the classifier.")
         else:
-            print("Invalid action. Please choose 'train_model' or 'run_model'.")
+            print("Invalid action. Please choose 'train_model', 'run_model' or 'autotune'.")
 
         continue_choice = input("\nDo you want to perform another action? (yes/no): ").strip().lower()
         if continue_choice != "yes":
@@ -5,13 +5,15 @@ import manage_datasets
 import image_preprocessing
 import split_dataset_single_class
 import cnn_image_classifier
+import embedding_classifier
 
 # Lista fișierelor disponibile și funcțiile asociate
 files = {
     "1": ("manage_datasets.py", manage_datasets.main),
     "2": ("image_preprocessing.py", image_preprocessing.main),
     "3": ("split_dataset_single_class.py", split_dataset_single_class.main),
-    "4": ("cnn_image_classifier.py", cnn_image_classifier.main)
+    "4": ("cnn_image_classifier.py", cnn_image_classifier.main),
+    "5": ("embedding_classifier.py", embedding_classifier.main)
 }
 
 """
@@ -43,6 +45,7 @@ Exemplu de Utilizare și Rulare din Consolă pentru fiecare fișier:
      - Enter the output directory for processed images (default: ./data_project/preprocessed/Custom):
      - Enter image width (default: 224):
      - Enter image height (default: 224):
+     - Use bounded-memory mode with resumable checkpoints (for very large datasets)? (yes/no):
 
 3. split_dataset_single_class.py:
    - Utilizare:
@@ -72,6 +75,19 @@ Exemplu de Utilizare și Rulare din Consolă pentru fiecare fișier:
          Enter the name of the class to manage (e.g., Oameni):
        - delete_class: Șterge toate rezultatele pentru o clasă specificată.
          Enter the name of the class to manage (e.g., Oameni):
+
+5. embedding_classifier.py:
+   - Utilizare:
+     Calculează o singură dată embedding-urile imaginilor cu un backbone comun (MobileNetV2 preantrenat sau stiva
+     convoluțională a unui model CNN antrenat) și le păstrează în cache pe disc, indexate după hash. Pentru fiecare clasă se antrenează doar un head
+     mic pe aceste embedding-uri, în câteva secunde; toate head-urile evaluează o imagine dintr-o singură trecere.
+   - Rulare:
+     python embedding_classifier.py
+     Exemplu interacțiune în consolă:
+     - Enter the backbone to use (mobilenet_v2 or custom) (default: mobilenet_v2):
+     - Enter the action you want to perform: train_head
+       Enter class names separated by commas (e.g., Oameni, Caini): Oameni, Caini
+     - Enter the action you want to perform: run_heads
 """
 
 
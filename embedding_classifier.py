@@ -0,0 +1,311 @@
+import os
+import sqlite3
+from pathlib import Path
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras import layers, models
+
+from cnn_image_classifier import (
+    BATCH_SIZE, IMG_SIZE, DATASET_PATH, RESULTS_PATH, MODELS_PATH, MANIFEST_FILE,
+    calculate_file_hash, list_image_paths, load_images_dataset,
+    PredictionManifest, AsyncResultWriter
+)
+
+# Configurări de bază
+EMBEDDINGS_PATH = "./data_project/embeddings"
+HASH_INDEX_FILE = f"{EMBEDDINGS_PATH}/file_hashes.sqlite"
+BACKBONES_PATH = f"{MODELS_PATH}/backbones"
+HEADS_PATH = f"{MODELS_PATH}/heads"
+DEFAULT_BACKBONE = "mobilenet_v2"
+CUSTOM_BACKBONE_PREFIX = "custom_"
+HEAD_EPOCHS = 30
+HEAD_BATCH_SIZE = 256
+HEAD_THRESHOLD = 0.5
+
+
+# Funcție pentru crearea backbone-ului din stiva convoluțională a unui model CNN antrenat
+def create_custom_backbone(source_class):
+    model_file = Path(f"{MODELS_PATH}/{source_class}.keras")
+    if not model_file.exists():
+        raise ValueError(f"Trained model for class '{source_class}' not found. Please train it first.")
+    conv_stack = tf.keras.models.load_model(model_file).layers[:6]  # Conv2D + MaxPooling2D (x3)
+    return models.Sequential([
+        layers.Input(shape=(IMG_SIZE[0], IMG_SIZE[1], 3)),
+        *conv_stack,
+        layers.GlobalAveragePooling2D()
+    ])
+
+
+# Funcție pentru crearea backbone-ului preantrenat (MobileNetV2, ImageNet)
+def create_pretrained_backbone():
+    inputs = layers.Input(shape=(IMG_SIZE[0], IMG_SIZE[1], 3))
+    x = layers.Rescaling(1.0 / 127.5, offset=-1)(inputs)  # Echivalent cu mobilenet_v2.preprocess_input
+    base = tf.keras.applications.MobileNetV2(
+        input_shape=(IMG_SIZE[0], IMG_SIZE[1], 3),
+        include_top=False,
+        weights="imagenet",
+        pooling="avg"
+    )
+    return models.Model(inputs, base(x))
+
+
+def prepare_backbone(backbone_name):
+    """
+    Creează și salvează backbone-ul la prima utilizare; un backbone `custom_<clasă>` este o copie
+    a stivei convoluționale a modelului antrenat pentru acea clasă.
+
+    Returnează calea fișierului și cheia backbone-ului (nume + hash). Cheia separă cache-ul de
+    embedding-uri și head-urile, astfel încât un backbone regenerat nu le amestecă niciodată cu cele
+    ale ponderilor anterioare. Pentru `custom_<clasă>`, hash-ul este cel al modelului sursă: după
+    reantrenarea clasei, copia este refăcută și primește o cheie nouă.
+    """
+    if backbone_name.startswith(CUSTOM_BACKBONE_PREFIX):
+        model_file = Path(f"{MODELS_PATH}/{backbone_name[len(CUSTOM_BACKBONE_PREFIX):]}.keras")
+        if not model_file.exists():
+            raise ValueError(f"Trained model '{model_file}' not found. Please train it first.")
+        backbone_key = f"{backbone_name}-{calculate_file_hash(model_file)[:12]}"
+        backbone_file = Path(f"{BACKBONES_PATH}/{backbone_key}.keras")
+    elif backbone_name == DEFAULT_BACKBONE:
+        backbone_file = Path(f"{BACKBONES_PATH}/{backbone_name}.keras")
+        backbone_key = None
+    else:
+        raise ValueError(f"Unknown backbone: {backbone_name}.")
+
+    if not backbone_file.exists():
+        print(f"Creating backbone '{backbone_name}'...")
+        if backbone_name == DEFAULT_BACKBONE:
+            backbone = create_pretrained_backbone()
+        else:
+            backbone = create_custom_backbone(backbone_name[len(CUSTOM_BACKBONE_PREFIX):])
+
+        backbone_file.parent.mkdir(parents=True, exist_ok=True)
+        backbone.save(backbone_file)
+        print(f"Backbone '{backbone_name}' saved at {backbone_file}.")
+
+    if backbone_key is None:
+        backbone_key = f"{backbone_name}-{calculate_file_hash(backbone_file)[:12]}"
+    return backbone_file, backbone_key
+
+
+def hash_files(image_paths, index_path=HASH_INDEX_FILE):
+    """
+    Returnează hash-urile MD5 ale fișierelor, folosind un index persistent (cale, dimensiune, mtime) -> hash,
+    astfel încât fișierele nemodificate nu sunt citite din nou la fiecare rulare.
+    """
+    index_path = Path(index_path)
+    index_path.parent.mkdir(parents=True, exist_ok=True)
+    connection = sqlite3.connect(str(index_path))
+    try:
+        connection.execute("CREATE TABLE IF NOT EXISTS file_hashes "
+                           "(path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, hash TEXT)")
+        hashes = []
+        for path in image_paths:
+            stat = os.stat(path)
+            row = connection.execute("SELECT size, mtime_ns, hash FROM file_hashes WHERE path = ?", (path,)).fetchone()
+            if row is not None and row[0] == stat.st_size and row[1] == stat.st_mtime_ns:
+                hashes.append(row[2])
+                continue
+            image_hash = calculate_file_hash(path)
+            connection.execute("INSERT OR REPLACE INTO file_hashes (path, size, mtime_ns, hash) VALUES (?, ?, ?, ?)",
+                               (path, stat.st_size, stat.st_mtime_ns, image_hash))
+            hashes.append(image_hash)
+        connection.commit()
+        return hashes
+    finally:
+        connection.close()
+
+
+def embedding_cache_path(backbone_key, image_hash):
+    return Path(EMBEDDINGS_PATH) / backbone_key / image_hash[:2] / f"{image_hash}.npy"
+
+
+def compute_embeddings(image_paths, backbone_file, backbone_key):
+    """
+    Returnează embedding-urile imaginilor și hash-urile fișierelor sursă, calculând cu backbone-ul
+    doar pe cele lipsă din cache. Cache-ul de pe disc este indexat după hash-ul MD5 al fișierului sursă.
+    """
+    hashes = hash_files(image_paths)
+    missing = [i for i, image_hash in enumerate(hashes)
+               if not embedding_cache_path(backbone_key, image_hash).exists()]
+    print(f"Embeddings: {len(image_paths) - len(missing)} cached, {len(missing)} to compute.")
+
+    if missing:
+        backbone = tf.keras.models.load_model(backbone_file)
+        # Autotune acordează doar `create_model`; backbone-urile folosesc batch-ul implicit
+        dataset = load_images_dataset([image_paths[i] for i in missing], batch_size=BATCH_SIZE)
+        offset = 0
+        for images in dataset:
+            vectors = backbone(images, training=False).numpy()
+            for j, vector in enumerate(vectors):
+                cache_file = embedding_cache_path(backbone_key, hashes[missing[offset + j]])
+                cache_file.parent.mkdir(parents=True, exist_ok=True)
+                # Scriere atomică, pentru a nu lăsa fișiere incomplete în cache
+                temp_file = cache_file.with_suffix(".tmp")
+                with open(temp_file, 'wb') as f:
+                    np.save(f, vector)
+                os.replace(temp_file, cache_file)
+            offset += len(vectors)
+
+    if not image_paths:
+        return np.empty((0, 0), dtype=np.float32), hashes
+    embeddings = np.stack([np.load(embedding_cache_path(backbone_key, image_hash)) for image_hash in hashes])
+    return embeddings, hashes
+
+
+def collect_split(split):
+    """
+    Returnează imaginile dintr-un split și clasa fiecăreia (numele subdirectorului din `Custom`).
+    """
+    split_dir = os.path.abspath(f"{DATASET_PATH}/{split}/Custom")
+    image_paths = list_image_paths(split_dir)
+    image_classes = np.array([Path(path).relative_to(split_dir).parts[0] for path in image_paths])
+    return image_paths, image_classes
+
+
+# Funcție pentru crearea unui head de clasificare pe embedding-uri
+def create_head(embedding_dim):
+    return models.Sequential([
+        layers.Input(shape=(embedding_dim,)),
+        layers.Dense(1, activation='sigmoid')
+    ])
+
+
+# Funcție pentru antrenarea head-urilor mai multor clase pe embedding-urile din cache
+def train_heads(class_names, backbone_name=DEFAULT_BACKBONE):
+    """
+    Embedding-urile fiecărui split sunt încărcate o singură dată și refolosite pentru toate clasele;
+    pentru fiecare clasă, imaginile celorlalte clase sunt exemplele negative.
+    """
+    print(f"Training heads for {', '.join(class_names)} on '{backbone_name}' embeddings...")
+    backbone_file, backbone_key = prepare_backbone(backbone_name)
+
+    train_paths, train_classes = collect_split("train")
+    val_paths, val_classes = collect_split("validation")
+    if not train_paths:
+        print(f"Error: no training images found in {DATASET_PATH}/train/Custom.")
+        return
+    train_embeddings, _ = compute_embeddings(train_paths, backbone_file, backbone_key)
+    val_embeddings = compute_embeddings(val_paths, backbone_file, backbone_key)[0] if val_paths else None
+
+    for selected_class in class_names:
+        train_labels = (train_classes == selected_class).astype(np.float32)
+        if not train_labels.any() or train_labels.all():
+            print(f"Error: training data for '{selected_class}' needs both positive and negative images "
+                  f"(other class directories in {DATASET_PATH}/train/Custom).")
+            continue
+        validation_data = None
+        if val_embeddings is not None:
+            validation_data = (val_embeddings, (val_classes == selected_class).astype(np.float32))
+
+        head = create_head(train_embeddings.shape[1])
+        head.compile(optimizer='adam', loss='binary_crossentropy', metrics=['accuracy'])
+        head.fit(
+            train_embeddings,
+            train_labels,
+            validation_data=validation_data,
+            epochs=HEAD_EPOCHS,
+            batch_size=HEAD_BATCH_SIZE,
+            verbose=0
+        )
+
+        # Head-urile sunt legate de ponderile exacte ale backbone-ului pe care au fost antrenate
+        head_file = Path(f"{HEADS_PATH}/{backbone_key}/{selected_class}.keras")
+        head_file.parent.mkdir(parents=True, exist_ok=True)
+        head.save(head_file)
+        if validation_data is not None:
+            _, val_accuracy = head.evaluate(*validation_data, verbose=0)
+            print(f"Validation accuracy for '{selected_class}': {val_accuracy:.3f}")
+        print(f"Head for class '{selected_class}' has been trained and saved at {head_file}.")
+
+
+# Funcție pentru rularea tuturor head-urilor pe setul de test, cu o singură trecere prin backbone
+def process_all_classes(backbone_name=DEFAULT_BACKBONE):
+    backbone_file, backbone_key = prepare_backbone(backbone_name)
+    heads_dir = Path(f"{HEADS_PATH}/{backbone_key}")
+    head_files = sorted(heads_dir.glob("*.keras"))
+    if not head_files:
+        print(f"No trained heads found in {heads_dir}. Please train at least one class first.")
+        return
+
+    test_paths = list_image_paths(f"{DATASET_PATH}/test/Custom")
+    results_root = Path(f"{RESULTS_PATH}/Embeddings_{backbone_key}")
+
+    # Manifest per clasă, legat de head-ul curent; după reantrenare, head-ul evaluează din nou toate imaginile.
+    # Calculăm embedding-uri doar pentru imaginile neclasificate de vreun head.
+    manifests = {}
+    for head_file in head_files:
+        class_results_dir = results_root / head_file.stem
+        class_results_dir.mkdir(parents=True, exist_ok=True)
+        manifests[head_file.stem] = PredictionManifest(class_results_dir / MANIFEST_FILE,
+                                                       calculate_file_hash(head_file))
+
+    pending = [path for path in test_paths
+               if any(path not in manifest.classified for manifest in manifests.values())]
+    print(f"Found {len(test_paths)} test images, {len(test_paths) - len(pending)} already classified by all heads.")
+
+    try:
+        # Hash-urile calculate pentru cache sunt refolosite la scriere, fiecare fișier este citit o singură dată
+        embeddings, hashes = compute_embeddings(pending, backbone_file, backbone_key) if pending else (None, [])
+        for head_file in head_files:
+            selected_class = head_file.stem
+            manifest = manifests[selected_class]
+            indices = [i for i, path in enumerate(pending) if path not in manifest.classified]
+            if not indices:
+                continue
+
+            head = tf.keras.models.load_model(head_file)
+            scores = head.predict(embeddings[indices], verbose=0).ravel()
+
+            # Salvăm originalele prin legături hard; nu avem nevoie de tensorii imaginilor
+            writer = AsyncResultWriter(results_root / selected_class, selected_class, manifest, link_originals=True)
+            try:
+                for i, score in zip(indices, scores):
+                    positive = bool(score >= HEAD_THRESHOLD)
+                    writer.submit(pending[i], None, int(positive), float(score), positive, 0, image_hash=hashes[i])
+            finally:
+                writer.close()
+            print(f"Class '{selected_class}': {int((scores >= HEAD_THRESHOLD).sum())} positive images.")
+    finally:
+        for manifest in manifests.values():
+            manifest.close()
+    print("All test images processed. End of sequence.")
+
+
+def main():
+    backbone_choice = input(f"Enter the backbone to use ({DEFAULT_BACKBONE} or custom) "
+                            f"(default: {DEFAULT_BACKBONE}): ").strip()
+    if not backbone_choice or backbone_choice == DEFAULT_BACKBONE:
+        backbone_name = DEFAULT_BACKBONE
+    elif backbone_choice == "custom":
+        # Backbone-ul custom folosește stiva convoluțională a unui model CNN deja antrenat
+        source_class = input("Enter the trained class model to take the conv layers from (e.g., Oameni): ").strip()
+        if not Path(f"{MODELS_PATH}/{source_class}.keras").exists():
+            print(f"Trained model for class '{source_class}' not found. Please train it first.")
+            return
+        backbone_name = f"{CUSTOM_BACKBONE_PREFIX}{source_class}"
+    else:
+        print(f"Invalid backbone. Please choose '{DEFAULT_BACKBONE}' or 'custom'.")
+        return
+
+    while True:
+        print("\nAvailable actions: train_head, run_heads")
+        action = input("Enter the action you want to perform: ").strip()
+
+        if action == "train_head":
+            class_names = input("Enter class names separated by commas (e.g., Oameni, Caini): ").strip()
+            class_names = [name.strip() for name in class_names.split(",") if name.strip()]
+            if class_names:
+                train_heads(class_names, backbone_name)
+        elif action == "run_heads":
+            process_all_classes(backbone_name)
+        else:
+            print("Invalid action. Please choose 'train_head' or 'run_heads'.")
+
+        continue_choice = input("\nDo you want to perform another action? (yes/no): ").strip().lower()
+        if continue_choice != "yes":
+            print("Exiting. Goodbye!")
+            break
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,113 @@
 from PIL import Image, ImageOps
 import os
 import hashlib
+import json
 import shutil
+import sqlite3
 from pathlib import Path
+from memory_utils import peak_rss_mb
 
 
-def preprocess_images_with_padding(source_dir, output_dir, target_size, mode, clean_output, padding_color=(0, 0, 0)):
+# Interval (număr de imagini) la care se salvează progresul în modul cu memorie limitată
+CHECKPOINT_INTERVAL = 1000
+
+
+def iter_image_files(source_dir):
+    """
+    Parcurge fișierele din director în flux, cu `os.scandir`, fără a lista totul în memorie.
+    """
+    with os.scandir(source_dir) as entries:
+        for entry in entries:
+            if "." in entry.name and entry.is_file():
+                yield Path(entry.path)
+
+
+def pad_image(image_path, target_size, mode, padding_color):
+    """
+    Redimensionează proporțional imaginea și o completează cu padding până la dimensiunea țintă.
+    """
+    with Image.open(image_path) as img:
+        # Conversie la modul specificat
+        img = img.convert(mode)
+
+        # Redimensionare proporțională
+        img.thumbnail(target_size, Image.Resampling.LANCZOS)
+
+        # Calcularea padding-ului
+        width, height = img.size
+        new_img = Image.new(mode, target_size, padding_color)
+        left = (target_size[0] - width) // 2
+        top = (target_size[1] - height) // 2
+        new_img.paste(img, (left, top))
+        return new_img
+
+
+class PreprocessingState:
+    """
+    Starea persistentă (SQLite) pentru modul cu memorie limitată: hash-urile văzute,
+    fișierele deja procesate și contoarele. Fiecare commit este un punct de reluare.
+    Parametrii rulării sunt salvați în stare; o reluare cu alți parametri este refuzată.
+    """
+
+    def __init__(self, state_path, params):
+        self.connection = sqlite3.connect(str(state_path))
+        self.connection.execute("CREATE TABLE IF NOT EXISTS seen_hashes (hash TEXT PRIMARY KEY)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS processed (name TEXT PRIMARY KEY)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS params (id INTEGER PRIMARY KEY CHECK (id = 1), value TEXT)")
+        self.connection.commit()
+
+        # Hash-urile și fișierele procesate au sens doar pentru aceeași sursă și aceleași transformări
+        params_json = json.dumps(params, sort_keys=True)
+        row = self.connection.execute("SELECT value FROM params WHERE id = 1").fetchone()
+        if row is None:
+            self.connection.execute("INSERT INTO params (id, value) VALUES (1, ?)", (params_json,))
+            self.connection.commit()
+        elif row[0] != params_json:
+            self.connection.close()
+            raise ValueError(f"Saved state {state_path} was created with different parameters "
+                             f"({row[0]}). Clean the output directory to start a new run.")
+
+        self.counters = {"processed": 0, "duplicates": 0, "errors": 0}
+        for name, value in self.connection.execute("SELECT name, value FROM counters"):
+            self.counters[name] = value
+
+    def is_processed(self, name):
+        return self.connection.execute("SELECT 1 FROM processed WHERE name = ?", (name,)).fetchone() is not None
+
+    def is_seen(self, img_hash):
+        return self.connection.execute("SELECT 1 FROM seen_hashes WHERE hash = ?", (img_hash,)).fetchone() is not None
+
+    def mark_processed(self, name, outcome, img_hash=None):
+        """
+        Înregistrează rezultatul final al unui fișier. Hash-ul este adăugat doar aici, după ce
+        imaginea a fost salvată, ca să nu existe hash-uri fără fișierul corespunzător.
+        """
+        if img_hash is not None:
+            self.connection.execute("INSERT OR IGNORE INTO seen_hashes (hash) VALUES (?)", (img_hash,))
+        self.connection.execute("INSERT OR IGNORE INTO processed (name) VALUES (?)", (name,))
+        self.counters[outcome] += 1
+
+    def checkpoint(self):
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO counters (name, value) VALUES (?, ?)", self.counters.items()
+        )
+        self.connection.commit()
+
+    def close(self, commit=True):
+        """
+        La o întrerupere (ex. Ctrl-C) se renunță la modificările de după ultimul checkpoint;
+        fișierele respective sunt procesate din nou la reluare.
+        """
+        if commit:
+            self.checkpoint()
+        else:
+            self.connection.rollback()
+        self.connection.close()
+
+
+def preprocess_images_with_padding(source_dir, output_dir, target_size, mode, clean_output, padding_color=(0, 0, 0),
+                                   bounded_memory=False):
     """
     Preprocesează imaginile: redimensionare proporțională, completare cu padding și conversie.
 
@@ -16,52 +118,126 @@ def preprocess_images_with_padding(source_dir, output_dir, target_size, mode, cl
         mode (str): Formatul imaginii (e.g., "RGB", "L" pentru tonuri de gri).
         clean_output (bool): Dacă este True, șterge imaginile procesate anterior.
         padding_color (tuple): Culoarea folosită pentru completarea bordurilor (default: negru).
+        bounded_memory (bool): Dacă este True, hash-urile și progresul sunt păstrate pe disc, cu
+            checkpoint-uri periodice, iar o rulare întreruptă continuă de unde a rămas.
     """
     source_dir = Path(source_dir)
     output_dir = Path(output_dir)
+    # Starea este păstrată lângă directorul de ieșire, nu în el, ca să nu fie tratată drept imagine
+    state_path = output_dir.parent / f".{output_dir.name}_preprocess_state.sqlite"
 
     # Șterge directorul de ieșire dacă este necesar
     if clean_output:
         if output_dir.exists():
             shutil.rmtree(output_dir)
+        if state_path.exists():
+            state_path.unlink()
         output_dir.mkdir(parents=True, exist_ok=True)
         print(f"Cleaned output directory: {output_dir}")
     else:
         output_dir.mkdir(parents=True, exist_ok=True)
 
+    if bounded_memory:
+        preprocess_images_bounded(source_dir, output_dir, state_path, target_size, mode, padding_color)
+        return
+
     # Hash pentru eliminarea duplicatelor
     seen_hashes = set()
 
-    for image_path in source_dir.glob("*.*"):
+    for image_path in iter_image_files(source_dir):
         try:
-            with Image.open(image_path) as img:
-                # Conversie la modul specificat
-                img = img.convert(mode)
+            new_img = pad_image(image_path, target_size, mode, padding_color)
 
-                # Redimensionare proporțională
-                img.thumbnail(target_size, Image.Resampling.LANCZOS)
+            # Calcularea hash-ului imaginii pentru eliminarea duplicatelor
+            img_hash = hashlib.md5(new_img.tobytes()).hexdigest()
+            if img_hash in seen_hashes:
+                print(f"Duplicate found and skipped: {image_path}")
+                continue
+            seen_hashes.add(img_hash)
 
-                # Calcularea padding-ului
-                width, height = img.size
-                new_img = Image.new(mode, target_size, padding_color)
-                left = (target_size[0] - width) // 2
-                top = (target_size[1] - height) // 2
-                new_img.paste(img, (left, top))
+            # Salvare imagine procesată
+            output_path = output_dir / image_path.name
+            new_img.save(output_path)
+            print(f"Processed and saved: {output_path}")
 
+        except Exception as e:
+            print(f"Error processing {image_path}: {e}")
+
+    report_peak_memory()
+
+
+def preprocess_images_bounded(source_dir, output_dir, state_path, target_size, mode, padding_color):
+    """
+    Varianta cu memorie limitată a preprocesării, pentru directoare cu zeci de milioane de imagini.
+    """
+    params = {
+        "source_dir": str(source_dir.resolve()),
+        "target_size": list(target_size),
+        "mode": mode,
+        "padding_color": list(padding_color) if isinstance(padding_color, (tuple, list)) else padding_color
+    }
+    try:
+        state = PreprocessingState(state_path, params)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return
+
+    if state.counters["processed"] or state.counters["duplicates"] or state.counters["errors"]:
+        print(f"Resuming from checkpoint: {state.counters['processed']} processed, "
+              f"{state.counters['duplicates']} duplicates, {state.counters['errors']} errors.")
+
+    since_checkpoint = 0
+    completed = False
+    try:
+        for image_path in iter_image_files(source_dir):
+            if state.is_processed(image_path.name):
+                continue
+
+            try:
+                new_img = pad_image(image_path, target_size, mode, padding_color)
+            except Exception as e:
+                # Imagine invalidă: eroare permanentă, nu mai este reîncercată
+                print(f"Error processing {image_path}: {e}")
+                state.mark_processed(image_path.name, "errors")
+            else:
                 # Calcularea hash-ului imaginii pentru eliminarea duplicatelor
                 img_hash = hashlib.md5(new_img.tobytes()).hexdigest()
-                if img_hash in seen_hashes:
+                if state.is_seen(img_hash):
                     print(f"Duplicate found and skipped: {image_path}")
-                    continue
-                seen_hashes.add(img_hash)
+                    state.mark_processed(image_path.name, "duplicates")
+                else:
+                    try:
+                        new_img.save(output_dir / image_path.name)
+                    except OSError as e:
+                        # Eroare tranzitorie (ex. disc plin): fișierul rămâne neprocesat și este reîncercat la reluare
+                        print(f"Error saving {image_path}: {e}")
+                    except Exception as e:
+                        # Ex. format de ieșire necunoscut: eroare permanentă
+                        print(f"Error processing {image_path}: {e}")
+                        state.mark_processed(image_path.name, "errors")
+                    else:
+                        state.mark_processed(image_path.name, "processed", img_hash)
 
-                # Salvare imagine procesată
-                output_path = output_dir / image_path.name
-                new_img.save(output_path)
-                print(f"Processed and saved: {output_path}")
+            since_checkpoint += 1
+            if since_checkpoint >= CHECKPOINT_INTERVAL:
+                state.checkpoint()
+                since_checkpoint = 0
+                print(f"Checkpoint: {state.counters['processed']} processed, "
+                      f"{state.counters['duplicates']} duplicates, {state.counters['errors']} errors.")
+                report_peak_memory()
+        completed = True
+    finally:
+        state.close(commit=completed)
+
+    print(f"Done: {state.counters['processed']} processed, "
+          f"{state.counters['duplicates']} duplicates, {state.counters['errors']} errors.")
+    report_peak_memory()
 
-        except Exception as e:
-            print(f"Error processing {image_path}: {e}")
+
+def report_peak_memory():
+    peak = peak_rss_mb()
+    if peak is not None:
+        print(f"Peak RSS: {peak:.1f} MB")
 
 
 def main():
@@ -99,13 +275,19 @@ def main():
         "Do you want to clean the processed images directory before running? (yes/no): ").strip().lower()
     clean_output = clean_output_choice == "yes"
 
+    # Modul cu memorie limitată, pentru seturi foarte mari de imagini
+    bounded_memory_choice = input(
+        "Use bounded-memory mode with resumable checkpoints (for very large datasets)? (yes/no): ").strip().lower()
+    bounded_memory = bounded_memory_choice == "yes"
+
     # Rularea funcției de preprocesare
     preprocess_images_with_padding(
         source_directory,
         output_directory,
         target_size,
         color_mode,
-        clean_output
+        clean_output,
+        bounded_memory=bounded_memory
     )
 
 
@@ -0,0 +1,17 @@
+import sys
+
+try:
+    import resource  # Disponibil doar pe sisteme POSIX
+except ImportError:
+    resource = None
+
+
+def peak_rss_mb():
+    """
+    Returnează memoria maximă (peak RSS) a procesului curent, în MB, sau None dacă nu poate fi măsurată.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux raportează în KB, macOS în octeți
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
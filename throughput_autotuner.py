@@ -0,0 +1,257 @@
+import os
+import sys
+import json
+import time
+import socket
+import hashlib
+import inspect
+import subprocess
+from pathlib import Path
+from memory_utils import peak_rss_mb
+
+# Configurări de bază
+AUTOTUNE_PATH = "./data_project/autotune.json"
+BATCH_SIZE_CANDIDATES = [16, 32, 64, 128]
+INTER_OP_CANDIDATES = [1, 2]
+DEFAULT_BATCH_SIZE = 32
+WARMUP_STEPS = 2
+TRIAL_STEPS = 10
+TRIAL_TIMEOUT = 900
+# Setată în procesele de trial, pentru ca acestea să nu aplice configurația salvată anterior
+TRIAL_ENV_VAR = "CNN_AUTOTUNE_TRIAL"
+RESULT_PREFIX = "AUTOTUNE_RESULT "
+
+
+def architecture_key(model_fn):
+    """
+    Cheie pentru arhitectura modelului, derivată din codul sursă al funcției care îl construiește.
+    Nu rulează operații TensorFlow, deci poate fi folosită înainte de configurarea thread-urilor.
+    """
+    source_hash = hashlib.md5(inspect.getsource(model_fn).encode("utf-8")).hexdigest()[:8]
+    return f"{model_fn.__name__}-{source_hash}"
+
+
+def config_key(arch_key):
+    return f"{socket.gethostname()}|{arch_key}"
+
+
+def load_tuned_config(arch_key, config_path=AUTOTUNE_PATH):
+    """
+    Returnează configurația salvată pentru host-ul curent și arhitectura dată, sau None.
+    """
+    config_path = Path(config_path)
+    if not config_path.exists():
+        return None
+    try:
+        with open(config_path, 'r', encoding='utf-8') as f:
+            return json.load(f).get(config_key(arch_key))
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"Warning: could not read autotune config {config_path}: {e}")
+        return None
+
+
+def save_tuned_config(arch_key, config, config_path=AUTOTUNE_PATH):
+    config_path = Path(config_path)
+    config_path.parent.mkdir(parents=True, exist_ok=True)
+    configs = {}
+    if config_path.exists():
+        with open(config_path, 'r', encoding='utf-8') as f:
+            configs = json.load(f)
+    configs[config_key(arch_key)] = config
+    temp_path = config_path.with_suffix(".tmp")
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(configs, f, indent=2)
+    os.replace(temp_path, config_path)
+
+
+def default_memory_ceiling_mb():
+    """
+    Plafon implicit: 80% din memoria fizică, dacă poate fi determinată.
+    """
+    try:
+        total = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (AttributeError, ValueError, OSError):
+        return None
+    return int(total * 0.8 / (1024 * 1024))
+
+
+def thread_candidates():
+    cpu_count = os.cpu_count() or 1
+    intra_values = sorted({max(1, cpu_count // 4), max(1, cpu_count // 2), cpu_count})
+    candidates = [(0, 0)]  # 0 = valorile implicite TensorFlow
+    candidates += [(intra, inter) for intra in intra_values for inter in INTER_OP_CANDIDATES]
+    return candidates
+
+
+def run_trial(settings):
+    """
+    Rulează un trial într-un proces nou: thread-urile TensorFlow pot fi setate doar înainte
+    de prima operație, deci fiecare combinație are nevoie de propriul proces.
+    """
+    import numpy as np
+    import tensorflow as tf
+    from cnn_image_classifier import IMG_SIZE, create_model
+
+    tf.config.threading.set_intra_op_parallelism_threads(settings["intra_op_threads"])
+    tf.config.threading.set_inter_op_parallelism_threads(settings["inter_op_threads"])
+
+    batch_size = settings["batch_size"]
+    images = tf.constant(np.random.uniform(0, 255, (batch_size, IMG_SIZE[0], IMG_SIZE[1], 3)).astype("float32"))
+    labels = tf.constant(np.random.randint(0, 2, (batch_size,)))
+
+    model = create_model(num_classes=2)
+    model.compile(optimizer='adam', loss='sparse_categorical_crossentropy', metrics=['accuracy'])
+
+    result = {}
+
+    # Inferență (ca în `process_class`)
+    for _ in range(WARMUP_STEPS):
+        model.predict_on_batch(images)
+    start = time.perf_counter()
+    for _ in range(TRIAL_STEPS):
+        model.predict_on_batch(images)
+    elapsed = time.perf_counter() - start
+    result["predict"] = {"images_per_sec": batch_size * TRIAL_STEPS / elapsed, "peak_rss_mb": peak_rss_mb()}
+
+    # Antrenare (pași ca în `train_model`)
+    for _ in range(WARMUP_STEPS):
+        model.train_on_batch(images, labels)
+    start = time.perf_counter()
+    for _ in range(TRIAL_STEPS):
+        model.train_on_batch(images, labels)
+    elapsed = time.perf_counter() - start
+    result["train"] = {"images_per_sec": batch_size * TRIAL_STEPS / elapsed, "peak_rss_mb": peak_rss_mb()}
+
+    return result
+
+
+def launch_trial(batch_size, intra_op_threads, inter_op_threads):
+    settings = {
+        "batch_size": batch_size,
+        "intra_op_threads": intra_op_threads,
+        "inter_op_threads": inter_op_threads
+    }
+    print(f"Trial: batch_size={batch_size}, intra_op={intra_op_threads}, inter_op={inter_op_threads}...")
+    try:
+        completed = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--trial", json.dumps(settings)],
+            capture_output=True, text=True, timeout=TRIAL_TIMEOUT,
+            env=dict(os.environ, **{TRIAL_ENV_VAR: "1"})
+        )
+    except subprocess.TimeoutExpired:
+        print("  Trial timed out.")
+        return None
+    if completed.returncode != 0:
+        # Ex. memorie insuficientă pentru batch-ul curent
+        error_lines = completed.stderr.strip().splitlines() or [f"exit code {completed.returncode}"]
+        print(f"  Trial failed: {error_lines[-1]}")
+        return None
+
+    result_lines = [line for line in completed.stdout.splitlines() if line.startswith(RESULT_PREFIX)]
+    if not result_lines:
+        print("  Trial produced no result.")
+        return None
+    result = json.loads(result_lines[-1][len(RESULT_PREFIX):])
+    for mode in ("predict", "train"):
+        print(f"  {mode}: {result[mode]['images_per_sec']:.1f} images/s, peak RSS: {result[mode]['peak_rss_mb']} MB")
+    return result
+
+
+def within_ceiling(mode_result, memory_ceiling_mb):
+    if memory_ceiling_mb is None or mode_result["peak_rss_mb"] is None:
+        return True
+    return mode_result["peak_rss_mb"] <= memory_ceiling_mb
+
+
+def autotune(memory_ceiling_mb=None, batch_sizes=None):
+    """
+    Caută cea mai bună configurație de throughput pentru antrenare și inferență cu modelul `create_model`.
+    Backbone-urile din `embedding_classifier` nu sunt acordate și folosesc batch-ul implicit.
+
+    Thread-urile sunt o setare la nivel de proces, deci sunt alese o singură dată, după media
+    geometrică a throughput-ului de antrenare și inferență la batch-ul implicit. Apoi, cu aceste
+    thread-uri, se alege batch-ul optim separat pentru fiecare mod, respectând plafonul de memorie.
+    """
+    from cnn_image_classifier import create_model
+
+    batch_sizes = batch_sizes or BATCH_SIZE_CANDIDATES
+    arch_key = architecture_key(create_model)
+    print(f"Autotuning on host '{socket.gethostname()}' ({os.cpu_count()} CPUs) for architecture '{arch_key}'.")
+    if memory_ceiling_mb is None:
+        print("No memory ceiling set.")
+    elif peak_rss_mb() is None:
+        print("Warning: peak memory cannot be measured on this platform; the memory ceiling is not enforced.")
+
+    # Etapa 1: thread-uri
+    best_threads, best_score = None, 0
+    for intra, inter in thread_candidates():
+        result = launch_trial(DEFAULT_BATCH_SIZE, intra, inter)
+        if result is None or not all(within_ceiling(result[mode], memory_ceiling_mb) for mode in result):
+            continue
+        score = (result["train"]["images_per_sec"] * result["predict"]["images_per_sec"]) ** 0.5
+        if score > best_score:
+            best_threads, best_score = (intra, inter), score
+
+    if best_threads is None:
+        print("Error: no thread configuration completed within the memory ceiling.")
+        return None
+
+    # Etapa 2: batch size pentru fiecare mod
+    intra, inter = best_threads
+    best = {mode: None for mode in ("train", "predict")}
+    for batch_size in batch_sizes:
+        result = launch_trial(batch_size, intra, inter)
+        if result is None:
+            continue
+        for mode in best:
+            if not within_ceiling(result[mode], memory_ceiling_mb):
+                continue
+            if best[mode] is None or result[mode]["images_per_sec"] > best[mode]["images_per_sec"]:
+                best[mode] = dict(result[mode], batch_size=batch_size)
+
+    if None in best.values():
+        print("Error: no batch size completed within the memory ceiling.")
+        return None
+
+    config = {
+        "intra_op_threads": intra,
+        "inter_op_threads": inter,
+        "train_batch_size": best["train"]["batch_size"],
+        "predict_batch_size": best["predict"]["batch_size"],
+        "train_images_per_sec": round(best["train"]["images_per_sec"], 1),
+        "predict_images_per_sec": round(best["predict"]["images_per_sec"], 1),
+        "cpu_count": os.cpu_count(),
+        "memory_ceiling_mb": memory_ceiling_mb,
+        "tuned_at": time.strftime("%Y-%m-%d %H:%M:%S")
+    }
+    save_tuned_config(arch_key, config)
+    print(f"Best configuration saved to {AUTOTUNE_PATH}: {json.dumps(config)}")
+    return config
+
+
+def main():
+    default_ceiling = default_memory_ceiling_mb()
+    ceiling = input(f"Enter the memory ceiling in MB (default: {default_ceiling}): ").strip()
+    try:
+        memory_ceiling_mb = int(ceiling) if ceiling else default_ceiling
+    except ValueError:
+        print(f"Invalid memory ceiling. Using default: {default_ceiling}.")
+        memory_ceiling_mb = default_ceiling
+
+    batch_input = input(f"Enter batch sizes to try, separated by commas "
+                        f"(default: {', '.join(map(str, BATCH_SIZE_CANDIDATES))}): ").strip()
+    try:
+        batch_sizes = [int(value) for value in batch_input.split(",")] if batch_input else None
+    except ValueError:
+        print("Invalid batch sizes. Using defaults.")
+        batch_sizes = None
+
+    autotune(memory_ceiling_mb, batch_sizes)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "--trial":
+        os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
+        print(RESULT_PREFIX + json.dumps(run_trial(json.loads(sys.argv[2]))))
+    else:
+        main()